@@ -0,0 +1,234 @@
+import colorsys
+
+import colorlover as cl
+import numpy as np
+import pytest
+from numpy.testing import assert_allclose, assert_array_equal
+from seaborn.external import husl
+from seaborn.palettes import blend_palette
+
+from colorbabel import translate
+from colorbabel.translate import (_rgb_to_husl_vec, _rgb_to_hex_vec,
+                                  _rgb_to_hsl_vec, _rgb_to_hslstr_vec,
+                                  _get_color_names, ColorTranslator)
+
+
+def _test_colors():
+    """Black, white, grays, channel ties and random rgb floats."""
+    special = [[0, 0, 0], [1, 1, 1], [.5, .5, .5], [.2, .2, .2],
+               [1, 0, 0], [0, 1, 0], [0, 0, 1],
+               [1, 1, 0], [0, 1, 1], [1, 0, 1],
+               [.5, .5, .2], [.2, .5, .5], [.5, .2, .5],
+               [1e-9, 0, 0]]
+    rng = np.random.RandomState(42)
+    quarters = rng.randint(0, 5, size=(200, 3)) / 4.
+    return np.vstack([special, quarters, rng.rand(1000, 3)])
+
+
+def test_rgb_to_husl_vec():
+    """Test the vectorized husl conversion against husl.rgb_to_husl."""
+    rgb = _test_colors()
+    expected = np.array([husl.rgb_to_husl(*ii) for ii in rgb])
+    assert_allclose(_rgb_to_husl_vec(rgb), expected, rtol=1e-9, atol=1e-8)
+    assert _rgb_to_husl_vec(rgb[0]).shape == (1, 3)
+
+
+def test_rgb_to_hex_vec():
+    """Test the vectorized hex conversion against husl.rgb_to_hex."""
+    rgb = _test_colors()
+    # Values that land exactly on a rounding boundary
+    halves = (np.arange(256)[:, np.newaxis] + .5) / 255. * [1, 0, 1]
+    rgb = np.vstack([rgb, np.clip(halves, 0, 1)])
+    expected = [husl.rgb_to_hex(ii) for ii in rgb]
+    assert _rgb_to_hex_vec(rgb) == expected
+
+
+def test_rgb_to_hsl_vec():
+    """Test the vectorized hsl conversion against colorsys and colorlover."""
+    rgb = _test_colors()
+    expected = np.array([colorsys.rgb_to_hls(*ii) for ii in rgb])[:, [0, 2, 1]]
+    assert_allclose(_rgb_to_hsl_vec(rgb), expected, rtol=1e-12, atol=1e-12)
+
+    expected = cl.to_hsl([tuple(ii) for ii in (rgb * 255.).tolist()])
+    assert _rgb_to_hslstr_vec(rgb) == expected
+
+
+def test_color_names_tree_matches_fallback(monkeypatch):
+    """Test that the KD-tree and brute-force name searches agree on ties."""
+    if translate._CSS3_TREE is None:
+        pytest.skip('scipy is not installed')
+    rng = np.random.RandomState(0)
+    rgb = rng.randint(0, 256, size=(50000, 3)).astype(float)
+    rgb = np.vstack([translate._CSS3_RGB, [[101, 154, 0], [25, 0, 230]], rgb])
+    names_tree = _get_color_names(rgb)
+    monkeypatch.setattr(translate, '_CSS3_TREE', None)
+    names_brute = _get_color_names(rgb)
+    assert names_tree == names_brute
+    assert names_brute[:len(translate._CSS3_NAMES)] == translate._CSS3_NAMES
+    assert names_brute[-50002:-50000] == ['olivedrab', 'mediumblue']
+
+
+def test_to_strings_names():
+    """Test color names for sampled colormaps, including ties."""
+    names = ColorTranslator(['red', 'blue']).to_strings(255, 'name')
+    assert names[0] == 'red' and names[-1] == 'blue'
+    assert names[229] == 'mediumblue'
+
+
+def _ramp_colors(n_colors=255):
+    """A 255-color rgba ramp with a non-linear blue channel."""
+    x = np.linspace(0, 1, n_colors)
+    return np.column_stack([.1 + .8 * x, .8 - .6 * x,
+                            .5 + .4 * np.sin(3 * x), np.ones(n_colors)])
+
+
+# (midpoint, mid_spread, log_amt), first / last changed row and expected
+# rows, computed with the original per-row np.average loop
+_MIDDLE_CASES = [
+    (('light', .4, 1e-3), (77, 176), {
+        77: [0.34368914, 0.61926547, 0.81564311],
+        126: [0.94954685, 0.94955236, 0.94994864],
+        127: [0.94955, 0.94955, 0.949949]}),
+    # More than 64 mid colors on each side
+    (('dark', .6, 1e-2), (52, 201), {
+        52: [0.26349061, 0.67687206, 0.72981093],
+        126: [0.1366385, 0.13669362, 0.14065636],
+        127: [0.13667, 0.13667, 0.14065998]}),
+    (((.1, .5, .9), .5, 1e-3), (65, 188), {
+        65: [0.30404955, 0.64645268, 0.77765084],
+        126: [0.10039685, 0.50000236, 0.89999864],
+        127: [0.1004, 0.5, 0.899999]}),
+    # One mid color on each side
+    (('light', .008, 1e-3), (127, 127), {
+        127: [0.94955, 0.94955, 0.949949]}),
+    # No mid colors, nothing changes
+    (('dark', .005, 1e-3), None, {}),
+]
+
+
+@pytest.mark.parametrize('args, changed, expected', _MIDDLE_CASES)
+def test_add_middle_color(args, changed, expected):
+    """Test _add_middle_color against values from the original loop."""
+    colors = _ramp_colors()
+    colors.setflags(write=False)
+    out = translate._add_middle_color(colors, *args)
+    unchanged = np.ones(len(colors), dtype=bool)
+    if changed is not None:
+        unchanged[changed[0]:changed[1] + 1] = False
+    assert_allclose(out[unchanged], colors[unchanged], rtol=0, atol=1e-12)
+    for row, values in expected.items():
+        assert_allclose(out[row, :3], values, rtol=0, atol=1e-8)
+    assert_allclose(out[:, 3], 1.)
+
+
+def test_to_diverging():
+    """Test to_diverging against values from the original implementation."""
+    trans = ColorTranslator([[1., 0, 0], [0, 0, 1]])
+    frac = np.linspace(0, 1, 5)
+    expected = [[1., 0., 0.], [0.75000384, 0., 0.24999616],
+                [0.94302586, 0.93952802, 0.94705332],
+                [0.24608997, 0., 0.75391003], [0., 0., 1.]]
+    assert_allclose(trans.to_diverging()(frac)[:, :3], expected,
+                    rtol=0, atol=1e-8)
+    expected = [[1., 0., 0.], [0.71557679, 0.01227947, 0.2166553],
+                [0.13718494, 0.13075425, 0.14120887],
+                [0.21915454, 0.0092226, 0.72994781], [0., 0., 1.]]
+    cmap = trans.to_diverging(center='dark', mid_spread=.6, log_amt=1e-2)
+    assert_allclose(cmap(frac)[:, :3], expected, rtol=0, atol=1e-8)
+
+
+@pytest.mark.parametrize('dtype', [np.float64, np.float32])
+def test_eval_matches_cmap(dtype):
+    """Test that _eval picks the same entries as the colormap itself."""
+    for colors in (['red', 'blue'], ['#ff0000', '#00ff00', '#0000ff']):
+        trans = ColorTranslator(colors)
+        n_colors = trans.cmap.N
+        edges = np.arange(n_colors + 1) / float(n_colors)
+        frac = np.hstack([0., 1., edges, np.nextafter(edges, 0),
+                          np.nextafter(edges, 1), np.linspace(0, 1, 1001)])
+        frac = np.clip(frac, 0, 1).astype(dtype)
+        assert_allclose(trans._eval(frac), trans.cmap(frac), rtol=0, atol=0)
+
+
+def test_call_integer_fractions():
+    """Test that integer input is treated as fractions, not lut indices."""
+    trans = ColorTranslator(['red', 'blue'])
+    expected = trans(np.array([0., 1.]))
+    assert_allclose(expected[:, :3], [[1, 0, 0], [0, 0, 1]])
+    assert_allclose(trans(np.array([0, 1])), expected)
+    assert_allclose(trans([0, 1]), expected)
+
+
+@pytest.mark.parametrize('dtype', [np.float64, np.int64, np.uint8])
+def test_init_numeric_colors(dtype):
+    """Test 0-255 numeric input is rescaled without changing the input."""
+    colors = np.array([[255, 0, 0], [0, 128, 255], [10, 200, 30]])
+    colors = colors.astype(dtype)
+    # The original implementation divided a copy by 255
+    frac = np.linspace(0, 1, 50)
+    expected = blend_palette(colors / 255., as_cmap=True)(frac)
+    # A view into a larger array, as well as the array and a plain list
+    view = np.repeat(colors, 2, axis=0)[::2]
+    for arr in (colors.copy(), view, colors.tolist()):
+        arr_orig = np.array(arr, copy=True)
+        assert_allclose(ColorTranslator(arr)(frac), expected, atol=1e-12)
+        assert_allclose(np.asarray(arr), arr_orig, rtol=0, atol=0)
+
+
+def test_call_validated():
+    """Test that skipping input checks doesn't change the output."""
+    trans = ColorTranslator(['red', 'blue'])
+    frac = np.linspace(0, 1, 17)
+    data = np.array([2., 5., 8., -1., 12.])
+    for kind, as_string in [('rgb', False), ('rgb', True),
+                            ('husl', False), ('husl', True)]:
+        kwargs = dict(kind=kind, as_string=as_string)
+        expected = trans(frac, **kwargs)
+        assert_array_equal(trans(frac, _validated=True, **kwargs), expected)
+        expected = trans(data, vmin=0, vmax=10, **kwargs)
+        assert_array_equal(trans(data, vmin=0, vmax=10, _validated=True,
+                                 **kwargs), expected)
+    with pytest.raises(ValueError):
+        trans([1.5])
+    with pytest.raises(ValueError):
+        trans([[.5]])
+
+
+def test_string_cache():
+    """Test that cached strings are returned as fresh, equal lists."""
+    trans = ColorTranslator(['red', 'blue'])
+    for kind in ('rgb', 'husl', 'hex', 'name'):
+        first = trans.to_strings(10, kind)
+        first_copy = list(first)
+        first.append('junk')
+        first[0] = 'junk'
+        second = trans.to_strings(10, kind)
+        assert second == first_copy
+        assert second is not first
+
+
+def test_caches_are_bounded():
+    """Test that the caches keep only the most recently used entries."""
+    trans = ColorTranslator(['red', 'blue'])
+    for n_bins in range(2, 2 + 3 * translate._CACHE_SIZE):
+        trans.to_strings(n_bins, 'hex')
+    assert len(trans._sample_cache) == translate._CACHE_SIZE
+    assert len(trans._string_cache) == translate._CACHE_SIZE
+
+    # A cache hit moves the entry to the end, so it survives eviction
+    oldest = next(iter(trans._string_cache))
+    expected = trans.to_strings(*oldest)
+    trans.to_strings(1000, 'hex')
+    assert oldest in trans._string_cache
+    assert trans.to_strings(*oldest) == expected
+
+    # Cached samples are read-only and to_numeric returns a copy
+    numeric = trans.to_numeric(10)
+    numeric[:] = 0
+    assert_allclose(trans.to_numeric(10)[[0, -1], :3], [[1, 0, 0], [0, 0, 1]])
+    with pytest.raises(ValueError):
+        trans._sample(10)[:] = 0
+
+    # Setting a new colormap clears both caches
+    trans.cmap = ColorTranslator(['green', 'blue']).cmap
+    assert not trans._sample_cache and not trans._string_cache
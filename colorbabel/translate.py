@@ -1,4 +1,5 @@
 """Quickly translate between different color representations."""
+from functools import lru_cache
 import seaborn.palettes as pl
 from seaborn import palplot
 from IPython.display import HTML
@@ -6,9 +7,26 @@ from matplotlib.colors import LinearSegmentedColormap, ListedColormap
 import numpy as np
 import matplotlib.pyplot as plt
 import colorlover as cl
+import webcolors as wb
+try:
+    from scipy.spatial import cKDTree
+except ImportError:
+    cKDTree = None
 
 __all__ = ['ColorTranslator']
 
+_INV_255 = 1. / 255.
+# Number of results kept by the per-instance caches of ColorTranslator
+_CACHE_SIZE = 8
+
+# css3 palette used for naming colors, shape (n_names, 3) rgb in 0-255
+_CSS3_RGB = np.array([wb.hex_to_rgb(key) for key in wb.css3_hex_to_names],
+                     dtype=float)
+_CSS3_NAMES = list(wb.css3_hex_to_names.values())
+_CSS3_TREE = cKDTree(_CSS3_RGB) if cKDTree is not None else None
+_NAME_TO_RGB = dict((name, np.array(wb.hex_to_rgb(key), dtype=float) / 255.)
+                    for name, key in wb.css3_names_to_hex.items())
+
 
 class ColorTranslator(object):
     """
@@ -40,13 +58,18 @@ class ColorTranslator(object):
             colors = colors
         else:
             if not isinstance(colors[0], str):
-                # Consider it an array of rgb/rgba
-                colors = np.atleast_2d(colors).astype(float)
+                # Consider it an array of rgb/rgba, only copied if needed
+                colors_in = colors
+                colors = np.atleast_2d(np.asarray(colors, dtype=float))
                 if colors.shape[-1] not in [3, 4]:
                     raise ValueError('if floats/ints, colors must have'
                                      ' a last dimension of shape 3 or 4')
-                if not ((colors >= 0) * (colors <= 1)).all():
-                    colors = colors / 255.
+                if not (colors.min() >= 0 and colors.max() <= 1):
+                    if np.may_share_memory(colors, colors_in):
+                        # Don't modify the user's array
+                        colors = colors * _INV_255
+                    else:
+                        colors *= _INV_255
             else:
                 if 'rgb' in colors[0]:
                     # Convert strings to numeric first
@@ -60,6 +83,47 @@ class ColorTranslator(object):
             colors = pl.blend_palette(colors, as_cmap=True)
         self.cmap = colors
 
+    @property
+    def cmap(self):
+        return self._cmap
+
+    @cmap.setter
+    def cmap(self, cmap):
+        self._cmap = cmap
+        # The colormap's own lookup table, one rgba row per cmap entry
+        self._lut = cmap(np.arange(cmap.N))
+        self._sample_cache = {}
+        self._string_cache = {}
+
+    def _eval(self, frac):
+        """Look up the colors for `frac`, which must be between 0 and 1.
+
+        For float input this gives the same result as `self.cmap(frac)`,
+        which picks the lookup table entry that `frac` falls in, but skips
+        the masking and bad/under/over color handling done by matplotlib.
+        Integer input is treated as fractions too (so 0 and 1 are the
+        first and last colors), where matplotlib would use them as
+        lookup table indices.
+        """
+        frac = np.asarray(frac)
+        if frac.dtype.kind != 'f':
+            frac = frac.astype(float)
+        ixs = (frac * self._lut.shape[0]).astype(np.intp)
+        return self._lut.take(ixs, axis=0, mode='clip')
+
+    def _sample(self, n_bins):
+        """Return `n_bins` evenly-spaced colors from self.cmap.
+
+        The most recently used results are cached per `n_bins` and marked
+        read-only, so callers must copy before modifying them.
+        """
+        colors = _cache_get(self._sample_cache, n_bins)
+        if colors is None:
+            colors = self._eval(np.linspace(0, 1, n_bins))
+            colors.setflags(write=False)
+            _cache_set(self._sample_cache, n_bins, colors)
+        return colors
+
     def to_numeric(self, n_bins=255, kind='rgb'):
         """Convert colormap to numeric array.
 
@@ -76,12 +140,11 @@ class ColorTranslator(object):
             An array of rgb / husl colors, evenly spaced through
             self.colormap.
         """
-        colors_numeric = self.cmap(np.linspace(0, 1, n_bins))
+        colors_numeric = self._sample(n_bins)
         if kind == 'husl':
-            colors_numeric = np.array([pl.husl.rgb_to_husl(r, g, b)
-                                       for r, g, b, _ in colors_numeric])
+            colors_numeric = _rgb_to_husl_vec(colors_numeric[:, :3])
         elif kind == 'rgb':
-            pass
+            colors_numeric = colors_numeric.copy()
         else:
             raise ValueError("kind {} not supported".format(kind))
         return colors_numeric
@@ -104,19 +167,23 @@ class ColorTranslator(object):
             use in plotly. Or a list of hex strings for online plotting. Or
             a list of names associated with the colors.
         """
+        colors_string = _cache_get(self._string_cache, (n_bins, kind))
+        if colors_string is not None:
+            return list(colors_string)
+
         # Remove the alpha
-        array = self.cmap(np.linspace(0, 1, n_bins))[:, :-1]
+        array = self._sample(n_bins)[:, :-1]
         if kind == 'hex':
-            colors_string = [pl.husl.rgb_to_hex(ii) for ii in array]
+            colors_string = _rgb_to_hex_vec(array)
         elif kind == 'name':
             colors_string = _get_color_names(array * 255.)
+        elif kind == 'rgb':
+            colors_string = _rgb_to_rgbstr_vec(array)
+        elif kind == 'husl':
+            colors_string = _rgb_to_hslstr_vec(array)
         else:
-            array = array * 255.
-            list_of_tups = [tuple(i) for i in array]
-            if kind == 'rgb':
-                colors_string = cl.to_rgb(list_of_tups)
-            elif kind == 'husl':
-                colors_string = cl.to_hsl(list_of_tups)
+            raise ValueError("kind {} not supported".format(kind))
+        _cache_set(self._string_cache, (n_bins, kind), tuple(colors_string))
         return colors_string
 
     def to_diverging(self, center='light', mid_spread=.4, log_amt=1e-3,
@@ -148,7 +215,7 @@ class ColorTranslator(object):
             The diverging colormap, created by interpolating between
             the first and last colors in self.cmap.
         """
-        out = _add_middle_color(self.to_numeric(), midpoint=center,
+        out = _add_middle_color(self._sample(255), midpoint=center,
                                 mid_spread=mid_spread, log_amt=log_amt)
         return pl.blend_palette(out, as_cmap=as_cmap)
 
@@ -174,59 +241,78 @@ class ColorTranslator(object):
             raise ValueError('n_bins must be type int or None')
 
     def __call__(self, data, kind='rgb', as_string=False,
-                 vmin=None, vmax=None):
+                 vmin=None, vmax=None, _validated=False):
         """Convert a subset of colors to a given type.
 
         Parameters
         ----------
         data : array, shape (n_colors,)
-            Must be an array of floats between 0 and 1. These
-            will be used to index into self.cmap.
+            Must be an array of values between 0 and 1. These
+            will be used to index into self.cmap. Integers are treated
+            as fractions, so 0 and 1 give the first and last colors.
         kind : 'rgb' | 'husl' | 'html'
             Whether to return output colors in rgb or husl space.
             If 'html', the color output of the call will be displayed.
         as_string : bool
             If True, return colors as plotly-style strings.
+        _validated : bool
+            If True, `data` is assumed to already be a 1-d array, and the
+            shape and range checks are skipped. Scaling with `vmin` /
+            `vmax` is still applied, so without them `data` must already
+            be between 0 and 1.
 
         Returns
         -------
         arr : np.array | list of strings
             The colors associated with values in `frac`.
         """
-        data = np.atleast_1d(data)
-        if data.ndim > 1:
-            raise ValueError('frac must be 1-d')
+        if not _validated:
+            data = np.atleast_1d(data)
+            if data.ndim > 1:
+                raise ValueError('frac must be 1-d')
         if vmin is not None or vmax is not None:
             # If we need to scale out data
             frac = np.clip((data - vmin) / float(vmax - vmin), 0, 1)
         else:
             frac = data
-        if not ((frac >= 0.) * (frac <= 1.)).all(0):
+        if not _validated and frac.size and not (frac.min() >= 0. and
+                                                 frac.max() <= 1.):
             raise ValueError('input must be between 0 and 1, you'
                              ' provided {}'.format(frac))
-        arr = self.cmap(frac)
+        arr = self._eval(frac)
         if kind == 'rgb':
             if as_string is False:
                 pass
             else:
-                arr = [tuple(i) for i in arr[:, :-1] * 255]
-                arr = cl.to_rgb(arr)
+                arr = _rgb_to_rgbstr_vec(arr[:, :3])
         elif kind == 'husl':
             if as_string is False:
-                arr = np.array([pl.husl.rgb_to_husl(r, g, b)
-                                for r, g, b, _ in arr])
+                arr = _rgb_to_husl_vec(arr[:, :3])
             else:
-                arr = [tuple(i) for i in arr[:, :-1] * 255]
-                arr = cl.to_hsl(arr)
+                arr = _rgb_to_hslstr_vec(arr[:, :3])
         elif kind == 'html':
-            arr = [tuple(i) for i in arr[:, :-1] * 255]
-            arr = cl.to_hsl(arr)
+            arr = _rgb_to_hslstr_vec(arr[:, :3])
             arr = HTML(cl.to_html(arr))
         else:
             raise ValueError("Kind {} not supported".format(kind))
         return arr
 
 
+def _cache_get(cache, key):
+    """Return `cache[key]`, marking it as most recently used, or None."""
+    if key not in cache:
+        return None
+    cache[key] = cache.pop(key)
+    return cache[key]
+
+
+def _cache_set(cache, key, value):
+    """Store `value` in `cache`, evicting the least recently used entry."""
+    cache[key] = value
+    if len(cache) > _CACHE_SIZE:
+        del cache[next(iter(cache))]
+
+
 def _add_middle_color(colors, midpoint, mid_spread=.3, log_amt=1e-3):
     """Converts the center of a colormap to a particular color."""
     mid_strings = dict(light=(.95, .95, .95),
@@ -238,6 +324,7 @@ def _add_middle_color(colors, midpoint, mid_spread=.3, log_amt=1e-3):
         midpoint = mid_strings[midpoint]
     if len(midpoint) != 3:
         raise ValueError('Midpoint must be a tuple/list of length 3')
+    midpoint = np.asarray(midpoint, dtype=float)
     if colors.ndim != 2:
         raise ValueError('Input colors must be 2d')
     if any([mid_spread <= 0, mid_spread >= 1]):
@@ -247,70 +334,207 @@ def _add_middle_color(colors, midpoint, mid_spread=.3, log_amt=1e-3):
     ix_mid = int(colors.shape[0] / 2)
     n_mid_colors = int(colors.shape[0] * (mid_spread / 2.))
 
-    # Get colors associated w/ the middle bounds
-    num_col_hi = colors[ix_mid + n_mid_colors, :3]
-    num_col_lo = colors[ix_mid - n_mid_colors, :3]
-
-    # Iterate through colors and add the midpoitn to middle indices
-    col_adds = []
-    for col_side in [num_col_lo, num_col_hi]:
-        # Iterate through rgb
-        this_side = []
-        for colmid, colend in zip(midpoint, col_side):
-            if col_side is num_col_hi:
-                lins = np.linspace(colmid, colend, n_mid_colors)
-            else:
-                lins = np.linspace(colend, colmid, n_mid_colors)
-            this_side.append(lins)
-        this_side = np.vstack(this_side)
-        col_adds.append(this_side)
-    col_adds = np.hstack(col_adds).T
+    # Only the middle of the colormap is changed
+    ix_lo = ix_mid - n_mid_colors
+    ix_hi = ix_mid + n_mid_colors
+    col_out = colors.copy()
+    _build_middle_patch(col_out[ix_lo:ix_hi, :3], colors[ix_lo, :3],
+                        colors[ix_hi, :3], midpoint, log_amt)
+    return col_out
+
+
+def _build_middle_patch(col_mid, col_lo, col_hi, midpoint, log_amt):
+    """Blend the midpoint color into the middle colors `col_mid` in place.
+
+    `col_mid` has shape (2 * n_mid_colors, 3), and `col_lo` / `col_hi` are
+    the colors at its lower and upper bounds.
+    """
+    n_mid_colors = col_mid.shape[0] // 2
+
+    # Interpolate from the middle bounds to the midpoint on each side
+    lo_side = np.linspace(col_lo, midpoint, n_mid_colors)
+    hi_side = np.linspace(midpoint, col_hi, n_mid_colors)
+    col_adds = np.vstack([lo_side, hi_side])
 
     # Now overwrite the old colors
+    weights = _mid_weights(n_mid_colors, log_amt)
+    col_mid *= weights[:, np.newaxis]
+    col_mid += col_adds * (1. - weights[:, np.newaxis])
+    return col_mid
+
+
+@lru_cache(maxsize=32)
+def _mid_weights(n_mid_colors, log_amt):
+    """Weights of the original colors, dropping off logarithmically.
+
+    The returned array is shared between calls, so it is read-only.
+    """
     weights = np.logspace(np.log10(log_amt), np.log10(1), n_mid_colors)
     weights = np.hstack([weights[::-1], weights])
-    col_out = colors.copy()
-    col_replace = col_out[ix_mid - n_mid_colors: ix_mid + n_mid_colors, :3]
+    weights.setflags(write=False)
+    return weights
 
-    col_zip = zip(col_replace, col_adds, weights)
-    colors_new = np.zeros([len(col_replace), 3])
-    for i, (cold, cnew, cweight) in enumerate(col_zip):
-        colors_new[i] = np.average([cold, cnew], axis=0,
-                                   weights=[cweight, 1-cweight])
 
-    col_out[ix_mid - n_mid_colors: ix_mid + n_mid_colors, :3] = colors_new
-    return col_out
+# Vectorized color conversions
+def _rgb_to_husl_vec(rgb):
+    """Convert an (n_colors, 3) array of rgb floats to husl.
+
+    This mirrors `husl.rgb_to_husl`, but operates on the full array at once
+    rather than calling the scalar function for each color.
+    """
+    husl = pl.husl
+    rgb = np.atleast_2d(np.asarray(rgb, dtype=float))
+
+    # rgb -> xyz
+    rgb_lin = np.where(rgb > .04045, ((rgb + .055) / 1.055) ** 2.4,
+                       rgb / 12.92)
+    X, Y, Z = (rgb_lin @ np.array(husl.m_inv).T).T
+
+    # xyz -> luv, black is special-cased to avoid dividing by zero
+    denom = X + 15. * Y + 3. * Z
+    Y_ref = Y / husl.refY
+    L = 116. * np.where(Y_ref > husl.lab_e, np.cbrt(Y_ref),
+                        7.787 * Y_ref + 16. / 116.) - 16.
+    black = (denom == 0) | (L == 0)
+    denom = np.where(black, 1., denom)
+    L = np.where(black, 0., L)
+    U = np.where(black, 0., 13. * L * (4. * X / denom - husl.refU))
+    V = np.where(black, 0., 13. * L * (9. * Y / denom - husl.refV))
+
+    # luv -> lch
+    C = np.hypot(U, V)
+    H = np.degrees(np.arctan2(V, U))
+    H = np.where(H < 0, H + 360., H)
+
+    # lch -> husl
+    too_light = L > 99.9999999
+    too_dark = L < 0.00000001
+    with np.errstate(divide='ignore', invalid='ignore'):
+        S = C / _max_chroma_vec(L, H) * 100.
+    S = np.where(too_light | too_dark, 0., S)
+    L = np.where(too_light, 100., np.where(too_dark, 0., L))
+    return np.column_stack([H, S, L])
+
+
+def _max_chroma_vec(L, H):
+    """Vectorized version of `husl.max_chroma` for arrays of L and H."""
+    hrad = np.radians(H)
+    sinH = np.sin(hrad)
+    cosH = np.cos(hrad)
+    sub1 = (L + 16.) ** 3 / 1560896.
+    sub2 = np.where(sub1 > 0.008856, sub1, L / 903.3)
+    result = np.full(np.shape(L), np.inf)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for m1, m2, m3 in pl.husl.m:
+            top = (0.99915 * m1 + 1.05122 * m2 + 1.14460 * m3) * sub2
+            rbottom = 0.86330 * m3 - 0.17266 * m2
+            lbottom = 0.12949 * m3 - 0.38848 * m1
+            bottom = (rbottom * sinH + lbottom * cosH) * sub2
+            for t in (0., 1.):
+                C = L * (top - 1.05122 * t) / (bottom + 0.17266 * sinH * t)
+                result = np.where((C > 0) & (C < result), C, result)
+    return result
+
+
+def _rgb_to_hex_vec(rgb):
+    """Convert an (n_colors, 3) array of rgb floats to hex strings.
+
+    Rounding follows `husl.rgb_to_hex` so the output strings are identical.
+    """
+    rgb = np.clip(np.round(np.atleast_2d(rgb), 3), 0, 1)
+    u8 = np.round(rgb * 255 + .001).astype(np.uint32)
+    packed = (u8[:, 0] << 16) | (u8[:, 1] << 8) | u8[:, 2]
+    return ['#{:06x}'.format(ii) for ii in packed.tolist()]
+
+
+def _rgb_to_hsl_vec(rgb):
+    """Convert an (n_colors, 3) array of rgb floats to hsl.
+
+    This mirrors `colorsys.rgb_to_hls`, but returns columns in h, s, l
+    order with all values between 0 and 1.
+    """
+    rgb = np.atleast_2d(np.asarray(rgb, dtype=float))
+    r, g, b = rgb.T
+    cmax = rgb.max(1)
+    cmin = rgb.min(1)
+    delta = cmax - cmin
+    light = (cmax + cmin) / 2.
+
+    # Grays have no hue or saturation
+    gray = delta == 0
+    delta = np.where(gray, 1., delta)
+    # Dividing by the sums, rather than 1 - |2l - 1|, avoids cancellation
+    # for very dark and very light colors
+    s = delta / np.where(gray, 1., np.where(light <= .5, cmax + cmin,
+                                            2. - cmax - cmin))
+
+    # Hue depends on which channel is largest, ties go to r, then g
+    h_r = ((g - b) / delta) % 6.
+    h_g = (b - r) / delta + 2.
+    h_b = (r - g) / delta + 4.
+    h = np.choose(np.argmax(rgb, axis=1), [h_r, h_g, h_b]) / 6.
+    return np.column_stack([np.where(gray, 0., h), np.where(gray, 0., s),
+                            light])
+
+
+def _rgb_to_rgbstr_vec(rgb):
+    """Convert an (n_colors, 3) array of rgb floats to "rgb()" strings."""
+    u8 = np.round(np.atleast_2d(rgb) * 255.).astype(int).tolist()
+    return ['rgb({}, {}, {})'.format(r, g, b) for r, g, b in u8]
+
+
+def _rgb_to_hslstr_vec(rgb):
+    """Convert an (n_colors, 3) array of rgb floats to "hsl()" strings.
+
+    Formatting follows `colorlover.to_hsl`.
+    """
+    hsl = np.round(_rgb_to_hsl_vec(rgb) * [360., 100., 100.]).astype(int)
+    return ['hsl({}, {}%, {}%)'.format(hue, sat, light)
+            for hue, sat, light in hsl.tolist()]
 
 
 # Color auto-names
 def _names_to_rgb(names):
-    import webcolors as wb
-    rgb = np.array([wb.name_to_rgb(i) for i in names])
-    return rgb / 255.
+    try:
+        return np.array([_NAME_TO_RGB[name.lower()] for name in names])
+    except KeyError as err:
+        raise ValueError('{} is not a css3 color name'.format(err))
 
 
-def _closest_color_from_rgb(rgb):
-    """Pulled from http://stackoverflow.com/questions/9694165/
-    convert-rgb-color-to-english-color-name-like-green
+def _get_color_names(array, chunk_size=2048):
+    """Get the closest css3 color name for each row of rgb values (0-255).
+
+    If scipy is available, a KD-tree of the palette is queried, and rows
+    with several equally close entries are passed to the brute-force
+    search so both give the same names. Otherwise distances to every
+    palette entry are computed at once, in chunks of `chunk_size` rows to
+    bound the size of the temporary distance matrix.
+    Exact matches have a distance of 0 and are picked up directly.
+    """
+    array = np.atleast_2d(np.asarray(array, dtype=float))[:, :3]
+    if _CSS3_TREE is not None:
+        dists, ixs = _CSS3_TREE.query(array, k=2)
+        ixs = ixs[:, 0]
+        # The tree breaks ties arbitrarily, resolve them like the fallback
+        tied = dists[:, 0] == dists[:, 1]
+        if tied.any():
+            ixs[tied] = _closest_css3_ixs(array[tied], chunk_size)
+    else:
+        ixs = _closest_css3_ixs(array, chunk_size)
+    return [_CSS3_NAMES[ix] for ix in ixs.tolist()]
+
+
+def _closest_css3_ixs(array, chunk_size=2048):
+    """Index of the closest css3 palette entry for each row of `array`.
+
+    When several entries are equally close, the last one in the palette is
+    used, as in the original dict-based lookup.
     """
-    import webcolors as wb
-    min_colors = {}
-    for key, name in wb.css3_hex_to_names.items():
-        base_color = np.asarray(wb.hex_to_rgb(key))
-        diff = base_color - np.asarray(rgb)
-        min_colors[np.sum(diff ** 2)] = name
-    return min_colors[np.min(list(min_colors.keys()))]
-
-
-def _get_color_names(array):
-    """Use webcolors to get the closest named color for rgb values"""
-    import webcolors as wb
-    array = np.atleast_2d(array)
-    color_names = []
-    for rgb in array:
-        try:
-            i_name = wb.rgb_to_name(rgb)
-        except ValueError:
-            i_name = _closest_color_from_rgb(rgb)
-        color_names.append(i_name)
-    return color_names
+    # Search the reversed palette so argmin returns the last minimum
+    palette = _CSS3_RGB[::-1]
+    ixs = np.empty(array.shape[0], dtype=np.intp)
+    for ii in range(0, array.shape[0], chunk_size):
+        chunk = array[ii:ii + chunk_size]
+        dists = ((palette[np.newaxis] - chunk[:, np.newaxis]) ** 2).sum(-1)
+        ixs[ii:ii + chunk_size] = len(palette) - 1 - dists.argmin(1)
+    return ixs